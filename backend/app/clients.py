@@ -0,0 +1,21 @@
+"""
+Shared Google Cloud clients.
+Created once per process so their HTTP connection pools and credentials
+are reused across engines and requests.
+"""
+
+from functools import lru_cache
+
+from google.cloud import storage, firestore
+
+from .config import get_settings
+
+
+@lru_cache()
+def get_storage_client() -> storage.Client:
+    return storage.Client(project=get_settings().gcp_project_id)
+
+
+@lru_cache()
+def get_firestore_client() -> firestore.Client:
+    return firestore.Client(project=get_settings().gcp_project_id)
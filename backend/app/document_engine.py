@@ -3,25 +3,44 @@ Document Processing Engine
 Handles PDF and Word document uploads, parsing, chunking, and storage.
 """
 
-import json
+import time
 import uuid
 import logging
-import base64
-from typing import List, Optional
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, List, Optional, Tuple
 from datetime import datetime, timedelta
+from io import BytesIO
+
+import orjson
+from cachetools import TTLCache
 
 import google.auth
-from google.auth import compute_engine
+from google.auth import compute_engine, impersonated_credentials
 from google.auth.transport import requests
+from google.api_core import exceptions as gcp_exceptions
+from google.api_core.retry import Retry, if_exception_type
 from google.cloud import storage, firestore
+from google.cloud.storage.retry import DEFAULT_RETRY
 
 from .config import get_settings
-from .parsers import PDFParser, DocxParser
+from .clients import get_storage_client, get_firestore_client
+from .parsers import PDFParser, DocxParser, ParseResult
 from .models.documents import DocumentUploadResponse, DocumentMetadata
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Retry batch commits that lose a contention race or hit a transient outage
+FIRESTORE_COMMIT_RETRY = Retry(
+    predicate=if_exception_type(
+        gcp_exceptions.Aborted,
+        gcp_exceptions.DeadlineExceeded,
+        gcp_exceptions.ServiceUnavailable,
+    )
+)
+
 
 class DocumentEngine:
     """Engine for processing and storing uploaded documents."""
@@ -29,11 +48,47 @@ class DocumentEngine:
     # Match existing YouTube transcript chunk size
     CHUNK_SIZE = 400
 
-    def __init__(self):
+    # Firestore allows 500 writes per batch; leave headroom
+    FIRESTORE_BATCH_SIZE = 400
+    # Stay under Firestore's sustained write limit across parallel commits
+    FIRESTORE_MAX_WRITES_PER_SEC = 10_000
+
+    # Resumable upload chunk size for streamed blobs (must be a multiple of 256KB)
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+    # Re-resolve signing credentials well inside the 1h token lifetime
+    SIGNING_CREDENTIALS_TTL = 1500
+
+    # Max documents whose original blob location is remembered in memory
+    BLOB_LOCATION_CACHE_SIZE = 10_000
+
+    # Per-process cache of Firestore document metadata
+    METADATA_CACHE_SIZE = 2048
+    METADATA_CACHE_TTL = 300
+
+    def __init__(
+        self,
+        storage_client: Optional[storage.Client] = None,
+        db: Optional[firestore.Client] = None,
+    ):
         self.settings = get_settings()
-        self.storage_client = storage.Client(project=self.settings.gcp_project_id)
+        self.storage_client = storage_client or get_storage_client()
         self.bucket = self.storage_client.bucket(self.settings.gcs_bucket)
-        self.db = firestore.Client(project=self.settings.gcp_project_id)
+        self.db = db or get_firestore_client()
+        self._executor = ThreadPoolExecutor(max_workers=40)
+
+        # (cached_at, credentials, service_account_email, signing_credentials)
+        self._signing_creds_cache: Optional[Tuple[float, Any, Optional[str], Any]] = None
+        self._signing_lock = threading.Lock()
+
+        # document_id -> (blob_path, source_type), least recently used first
+        self._blob_locations: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self._blob_locations_lock = threading.Lock()
+
+        self._metadata_cache = TTLCache(
+            maxsize=self.METADATA_CACHE_SIZE, ttl=self.METADATA_CACHE_TTL
+        )
+        self._metadata_cache_lock = threading.Lock()
 
         self.parsers = {
             "pdf": PDFParser(),
@@ -49,48 +104,37 @@ class DocumentEngine:
             return self.parsers["docx"], "docx"
         return None, None
 
-    def chunk_text(self, text: str, page_number: int, section: str) -> List[dict]:
+    def chunk_text(self, text: str) -> Iterator[str]:
         """
-        Split text into chunks of ~400 chars while preserving metadata.
+        Split text into chunks of ~400 chars.
+
+        Page and section metadata are constant for a page's chunks, so the
+        caller attaches them rather than copying them into every chunk.
 
         Args:
             text: Text content to chunk
-            page_number: Page number this text came from
-            section: Section heading (if any)
 
-        Returns:
-            List of chunk dictionaries with metadata
+        Yields:
+            Chunk contents, in order, as they are packed
         """
-        chunks = []
-        words = text.split()
-        current_chunk = ""
-        chunk_index = 0
+        cur_words: List[str] = []
+        cur_len = 0
 
-        for word in words:
+        for word in text.split():
             # Check if adding this word would exceed chunk size
-            if len(current_chunk) + len(word) + 1 > self.CHUNK_SIZE:
-                if current_chunk:
-                    chunks.append({
-                        "page_number": page_number,
-                        "section_heading": section,
-                        "content": current_chunk.strip(),
-                        "chunk_index": chunk_index,
-                    })
-                    chunk_index += 1
-                current_chunk = word
+            if cur_len + len(word) + 1 > self.CHUNK_SIZE:
+                if cur_words:
+                    yield " ".join(cur_words)
+                    cur_words.clear()
+                cur_words.append(word)
+                cur_len = len(word)
             else:
-                current_chunk += " " + word if current_chunk else word
+                cur_len += len(word) + 1 if cur_words else len(word)
+                cur_words.append(word)
 
         # Don't forget remaining content
-        if current_chunk.strip():
-            chunks.append({
-                "page_number": page_number,
-                "section_heading": section,
-                "content": current_chunk.strip(),
-                "chunk_index": chunk_index,
-            })
-
-        return chunks
+        if cur_words:
+            yield " ".join(cur_words)
 
     def create_jsonl_documents(
         self,
@@ -116,39 +160,62 @@ class DocumentEngine:
         Returns:
             List of JSONL document dictionaries
         """
-        documents = []
+        # Allocate the list once from an estimate of the chunk count; chunks
+        # are rarely much shorter than CHUNK_SIZE - 50, and any overflow
+        # (e.g. very long words) just appends
+        estimated_chunks = (
+            sum(len(text) for _, _, text in pages) // (self.CHUNK_SIZE - 50) + len(pages)
+        )
+        documents = [None] * estimated_chunks
         chunks_to_upload = []  # Store chunks to upload as .txt files
         global_chunk_index = 0
+        chunk_uri_prefix = f"gs://{self.settings.gcs_bucket}/{self.settings.documents_prefix}/chunks/"
+
+        # Fields shared by every chunk; per-chunk values are filled into a copy.
+        # Placeholders keep the key order of the emitted JSON stable.
+        struct_base = {
+            "source_type": source_type,
+            "document_id": document_id,
+            "title": title,
+            "filename": filename,
+            "page_number": None,
+            "section_heading": "",
+            "chunk_index": None,
+            "document_url": gcs_document_url,
+            # Include content in structData for search/display
+            "transcript": None,
+        }
 
         for page_number, section_heading, text in pages:
-            chunks = self.chunk_text(text, page_number, section_heading)
+            section_str = section_heading or ""
 
-            for chunk in chunks:
+            for content in self.chunk_text(text):
                 chunk_id = f"doc_{document_id}_{global_chunk_index}"
-                chunks_to_upload.append((chunk_id, chunk["content"]))
+                chunks_to_upload.append((chunk_id, content))
+
+                struct_data = struct_base.copy()
+                struct_data["page_number"] = page_number
+                struct_data["section_heading"] = section_str
+                struct_data["chunk_index"] = global_chunk_index
+                struct_data["transcript"] = content
 
                 doc = {
                     "id": chunk_id,
-                    "structData": {
-                        "source_type": source_type,
-                        "document_id": document_id,
-                        "title": title,
-                        "filename": filename,
-                        "page_number": chunk["page_number"],
-                        "section_heading": chunk["section_heading"] or "",
-                        "chunk_index": global_chunk_index,
-                        "document_url": gcs_document_url,
-                        # Include content in structData for search/display
-                        "transcript": chunk["content"],
-                    },
+                    "structData": struct_data,
                     "content": {
                         "mimeType": "text/plain",
-                        "uri": f"gs://{self.settings.gcs_bucket}/{self.settings.documents_prefix}/chunks/{chunk_id}.txt"
+                        "uri": f"{chunk_uri_prefix}{chunk_id}.txt",
                     },
                 }
-                documents.append(doc)
+                if global_chunk_index < estimated_chunks:
+                    documents[global_chunk_index] = doc
+                else:
+                    documents.append(doc)
                 global_chunk_index += 1
 
+        # Drop unused preallocated slots
+        del documents[global_chunk_index:]
+
         # Upload individual .txt files for each chunk (matching transcript format)
         for chunk_id, text in chunks_to_upload:
             blob_path = f"{self.settings.documents_prefix}/chunks/{chunk_id}.txt"
@@ -157,6 +224,10 @@ class DocumentEngine:
 
         return documents
 
+    def original_blob_path(self, document_id: str, filename: str) -> str:
+        """Blob path of the original upload for a document."""
+        return f"{self.settings.documents_prefix}/originals/{document_id}/{filename}"
+
     def upload_original_to_gcs(
         self, document_id: str, filename: str, content: bytes
     ) -> str:
@@ -171,8 +242,10 @@ class DocumentEngine:
         Returns:
             GCS URI for the uploaded file
         """
-        blob_path = f"{self.settings.documents_prefix}/originals/{document_id}/{filename}"
-        blob = self.bucket.blob(blob_path)
+        blob_path = self.original_blob_path(document_id, filename)
+        # A chunk size makes this a resumable upload sent in UPLOAD_CHUNK_SIZE
+        # pieces, so a transient failure retries one chunk, not the whole file
+        blob = self.bucket.blob(blob_path, chunk_size=self.UPLOAD_CHUNK_SIZE)
 
         # Determine content type
         if filename.lower().endswith(".pdf"):
@@ -180,7 +253,12 @@ class DocumentEngine:
         else:
             content_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
 
-        blob.upload_from_string(content, content_type=content_type)
+        blob.upload_from_file(
+            BytesIO(content),
+            size=len(content),
+            content_type=content_type,
+            retry=DEFAULT_RETRY,
+        )
 
         gcs_uri = f"gs://{self.settings.gcs_bucket}/{blob_path}"
         logger.info(f"Uploaded original document to {gcs_uri}")
@@ -200,8 +278,16 @@ class DocumentEngine:
         blob_path = f"{self.settings.documents_prefix}/jsonl/{document_id}.jsonl"
         blob = self.bucket.blob(blob_path)
 
-        jsonl_content = "\n".join(json.dumps(doc) for doc in documents)
-        blob.upload_from_string(jsonl_content, content_type="application/jsonl")
+        # Stream records straight into a resumable upload rather than
+        # building the whole file (and its UTF-8 copy) in memory
+        with blob.open(
+            "wb",
+            chunk_size=self.UPLOAD_CHUNK_SIZE,
+            content_type="application/jsonl",
+        ) as f:
+            for doc in documents:
+                f.write(orjson.dumps(doc))
+                f.write(b"\n")
 
         gcs_uri = f"gs://{self.settings.gcs_bucket}/{blob_path}"
         logger.info(f"Uploaded JSONL to {gcs_uri}")
@@ -211,30 +297,121 @@ class DocumentEngine:
         """Save document metadata to Firestore."""
         doc_ref = self.db.collection("documents").document(metadata.document_id)
         doc_ref.set(metadata.model_dump(mode="json"))
+        with self._metadata_cache_lock:
+            self._metadata_cache.pop(metadata.document_id, None)
         logger.info(f"Saved metadata for document {metadata.document_id}")
 
+    def save_document_metadata_bulk(self, metadatas: List[DocumentMetadata]):
+        """
+        Save many document metadata records to Firestore.
+
+        Records are grouped into WriteBatches of FIRESTORE_BATCH_SIZE and the
+        batches are committed in parallel, paced so the aggregate rate stays
+        under FIRESTORE_MAX_WRITES_PER_SEC.
+        """
+        collection = self.db.collection("documents")
+        min_interval = self.FIRESTORE_BATCH_SIZE / self.FIRESTORE_MAX_WRITES_PER_SEC
+        futures = []
+        last_submit = 0.0
+
+        for i in range(0, len(metadatas), self.FIRESTORE_BATCH_SIZE):
+            batch = self.db.batch()
+            for metadata in metadatas[i:i + self.FIRESTORE_BATCH_SIZE]:
+                batch.set(
+                    collection.document(metadata.document_id),
+                    metadata.model_dump(mode="json"),
+                )
+
+            wait = last_submit + min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            last_submit = time.monotonic()
+            futures.append(
+                self._executor.submit(batch.commit, retry=FIRESTORE_COMMIT_RETRY)
+            )
+
+        # Surface the first commit error, if any
+        for future in futures:
+            future.result()
+
+        with self._metadata_cache_lock:
+            for metadata in metadatas:
+                self._metadata_cache.pop(metadata.document_id, None)
+
+        logger.info(f"Saved metadata for {len(metadatas)} documents")
+
     def get_document_metadata(self, document_id: str) -> Optional[dict]:
-        """Get document metadata from Firestore."""
+        """
+        Get document metadata from Firestore.
+
+        Found documents are cached for METADATA_CACHE_TTL seconds. The cache
+        is per process; metadata is rarely rewritten, and the TTL bounds how
+        stale another worker's copy can get.
+        """
+        with self._metadata_cache_lock:
+            metadata = self._metadata_cache.get(document_id)
+        if metadata is not None:
+            return metadata
+
         doc_ref = self.db.collection("documents").document(document_id)
         doc = doc_ref.get()
         if doc.exists:
-            return doc.to_dict()
+            metadata = doc.to_dict()
+            with self._metadata_cache_lock:
+                self._metadata_cache[document_id] = metadata
+            return metadata
         return None
 
-    def generate_signed_url(
-        self, document_id: str, page_number: Optional[int] = None, expiration_minutes: int = 60
-    ) -> Optional[str]:
+    def _get_signing_credentials(self):
         """
-        Generate a signed URL for viewing a document.
+        Return credentials for signing URLs, or None to sign with the default
+        (service account key) credentials.
 
-        Args:
-            document_id: Document identifier
-            page_number: Optional page number for PDF deep-linking
-            expiration_minutes: URL expiration time in minutes
+        The result is cached for SIGNING_CREDENTIALS_TTL seconds so signing a
+        URL doesn't pay for credential discovery and a metadata-server refresh
+        each time. Reusing the impersonated credentials object also keeps its
+        own cached access token.
+        """
+        with self._signing_lock:
+            cache = self._signing_creds_cache
+            if cache is None or time.monotonic() - cache[0] > self.SIGNING_CREDENTIALS_TTL:
+                # Get credentials
+                credentials, project = google.auth.default()
+                sa_email = None
+                signing_credentials = None
+
+                # If running on Cloud Run/GCE, use impersonated credentials for signing
+                if isinstance(credentials, compute_engine.Credentials):
+                    # Refresh to get service account email
+                    credentials.refresh(requests.Request())
+                    sa_email = credentials.service_account_email
+
+                    # Create impersonated credentials that can sign
+                    # This uses IAM SignBlob API behind the scenes
+                    signing_credentials = impersonated_credentials.Credentials(
+                        source_credentials=credentials,
+                        target_principal=sa_email,
+                        target_scopes=["https://www.googleapis.com/auth/devstorage.read_only"],
+                    )
+
+                cache = (time.monotonic(), credentials, sa_email, signing_credentials)
+                self._signing_creds_cache = cache
+
+            return cache[3]
+
+    def _get_original_location(self, document_id: str) -> Optional[Tuple[str, str]]:
+        """
+        Look up (blob_path, source_type) of a document's original upload.
 
-        Returns:
-            Signed URL with optional #page=N fragment, or None if document not found
+        Originals never move once uploaded, so successful lookups are kept in
+        a bounded in-memory LRU and only misses go to Firestore.
         """
+        with self._blob_locations_lock:
+            location = self._blob_locations.get(document_id)
+            if location is not None:
+                self._blob_locations.move_to_end(document_id)
+                return location
+
         metadata = self.get_document_metadata(document_id)
         if not metadata:
             return None
@@ -246,30 +423,53 @@ class DocumentEngine:
 
         # Parse gs://bucket/path format
         path_part = gcs_uri.replace(f"gs://{self.settings.gcs_bucket}/", "")
-        blob = self.bucket.blob(path_part)
+        location = (path_part, metadata.get("source_type"))
+
+        with self._blob_locations_lock:
+            self._blob_locations[document_id] = location
+            if len(self._blob_locations) > self.BLOB_LOCATION_CACHE_SIZE:
+                self._blob_locations.popitem(last=False)
+
+        return location
+
+    def generate_signed_url(
+        self,
+        document_id: str,
+        page_number: Optional[int] = None,
+        expiration_minutes: int = 60,
+        filename: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        Generate a signed URL for viewing a document.
+
+        Args:
+            document_id: Document identifier
+            page_number: Optional page number for PDF deep-linking
+            expiration_minutes: URL expiration time in minutes
+            filename: Optional original filename; when given, the blob path is
+                derived directly and Firestore is not consulted
+
+        Returns:
+            Signed URL with optional #page=N fragment, or None if document not found
+        """
+        if filename:
+            # Don't let a crafted filename point outside this document's folder
+            if "/" in filename or filename in (".", ".."):
+                return None
+            blob_path = self.original_blob_path(document_id, filename)
+            _, source_type = self.get_parser(filename)
+        else:
+            location = self._get_original_location(document_id)
+            if not location:
+                return None
+            blob_path, source_type = location
+
+        blob = self.bucket.blob(blob_path)
 
         try:
-            # Get credentials
-            credentials, project = google.auth.default()
-
-            # If running on Cloud Run/GCE, use impersonated credentials for signing
-            if isinstance(credentials, compute_engine.Credentials):
-                from google.auth import impersonated_credentials
-                from google.auth.transport import requests as auth_requests
-
-                # Refresh to get service account email
-                auth_request = auth_requests.Request()
-                credentials.refresh(auth_request)
-                sa_email = credentials.service_account_email
-
-                # Create impersonated credentials that can sign
-                # This uses IAM SignBlob API behind the scenes
-                signing_credentials = impersonated_credentials.Credentials(
-                    source_credentials=credentials,
-                    target_principal=sa_email,
-                    target_scopes=["https://www.googleapis.com/auth/devstorage.read_only"],
-                )
+            signing_credentials = self._get_signing_credentials()
 
+            if signing_credentials is not None:
                 # Generate signed URL with impersonated credentials
                 url = blob.generate_signed_url(
                     version="v4",
@@ -286,7 +486,7 @@ class DocumentEngine:
                 )
 
             # Add page fragment for PDFs
-            if page_number and metadata.get("source_type") == "pdf":
+            if page_number and source_type == "pdf":
                 url = f"{url}#page={page_number}"
 
             return url
@@ -296,7 +496,11 @@ class DocumentEngine:
             raise
 
     def process_document(
-        self, file_content: bytes, filename: str, title: Optional[str] = None
+        self,
+        file_content: bytes,
+        filename: str,
+        title: Optional[str] = None,
+        parsed: Optional[ParseResult] = None,
     ) -> DocumentUploadResponse:
         """
         Main entry point: process and upload a document.
@@ -305,6 +509,8 @@ class DocumentEngine:
             file_content: Raw file bytes
             filename: Original filename
             title: Optional document title (defaults to filename without extension)
+            parsed: Result of parsing file_content elsewhere (e.g. in a worker
+                process); parsed here when not given
 
         Returns:
             DocumentUploadResponse with success status and details
@@ -326,9 +532,10 @@ class DocumentEngine:
 
         try:
             # Parse document
-            logger.info(f"Parsing {filename} as {source_type}")
-            pages = parser.parse(file_content, filename)
-            page_count = parser.get_page_count(file_content)
+            if parsed is None:
+                logger.info(f"Parsing {filename} as {source_type}")
+                parsed = parser.parse(file_content, filename)
+            pages, page_count = parsed
 
             if not pages:
                 return DocumentUploadResponse(
@@ -340,18 +547,27 @@ class DocumentEngine:
                     error="No text content could be extracted from the document",
                 )
 
-            # Upload original document
-            gcs_document_url = self.upload_original_to_gcs(
-                document_id, filename, file_content
+            # Upload original document in the background; its URI is
+            # deterministic, so chunking doesn't need to wait for it
+            original_upload = self._executor.submit(
+                self.upload_original_to_gcs, document_id, filename, file_content
             )
-
-            # Create JSONL chunks
-            jsonl_docs = self.create_jsonl_documents(
-                document_id, doc_title, filename, source_type, pages, gcs_document_url
+            gcs_document_url = (
+                f"gs://{self.settings.gcs_bucket}/"
+                f"{self.original_blob_path(document_id, filename)}"
             )
 
-            # Upload JSONL
-            gcs_jsonl_uri = self.upload_jsonl_to_gcs(document_id, jsonl_docs)
+            try:
+                # Create JSONL chunks
+                jsonl_docs = self.create_jsonl_documents(
+                    document_id, doc_title, filename, source_type, pages, gcs_document_url
+                )
+
+                # Upload JSONL
+                gcs_jsonl_uri = self.upload_jsonl_to_gcs(document_id, jsonl_docs)
+            finally:
+                # Both uploads must finish before metadata points at them
+                original_upload.result()
 
             # Save metadata
             self.save_document_metadata(
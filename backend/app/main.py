@@ -3,15 +3,24 @@ Bedini Bot Backend API
 FastAPI service for syncing YouTube transcripts and querying Vertex AI Search.
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile, Form
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, File, UploadFile, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
 
 from .config import get_settings
-from .sync_engine import SyncEngine, list_channel_videos, test_transcript
+from .sync_engine import SyncEngine
 from .document_engine import DocumentEngine
 from .models.documents import DocumentUploadResponse
+from .parsers import parse_document
 
 app = FastAPI(
     title="Bedini Bot API",
@@ -29,6 +38,33 @@ app.add_middleware(
 )
 
 
+# FastAPI resolves sync dependencies on its threadpool, so concurrent first
+# requests could otherwise each build an engine (and its executor and caches)
+_engine_lock = threading.Lock()
+_sync_engine: Optional[SyncEngine] = None
+_document_engine: Optional[DocumentEngine] = None
+
+
+def get_sync_engine() -> SyncEngine:
+    """Process-wide SyncEngine so GCP client connection pools are reused."""
+    global _sync_engine
+    if _sync_engine is None:
+        with _engine_lock:
+            if _sync_engine is None:
+                _sync_engine = SyncEngine()
+    return _sync_engine
+
+
+def get_document_engine() -> DocumentEngine:
+    """Process-wide DocumentEngine so GCP client connection pools are reused."""
+    global _document_engine
+    if _document_engine is None:
+        with _engine_lock:
+            if _document_engine is None:
+                _document_engine = DocumentEngine()
+    return _document_engine
+
+
 class SyncRequest(BaseModel):
     limit: Optional[int] = None
     force: bool = False
@@ -58,19 +94,20 @@ async def root():
 
 
 @app.get("/videos")
-async def get_videos(limit: int = 20):
+async def get_videos(limit: int = 20, engine: SyncEngine = Depends(get_sync_engine)):
     """List videos from Spencer's channel."""
     try:
-        videos = list_channel_videos(limit=limit)
+        videos = list(engine.get_channel_videos(limit=limit))
         return {"videos": videos, "count": len(videos)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/videos/{video_id}/transcript")
-async def get_transcript(video_id: str):
+async def get_transcript(video_id: str, engine: SyncEngine = Depends(get_sync_engine)):
     """Test if a video has an available transcript."""
-    transcript = test_transcript(video_id)
+    # fetch_transcript sleeps between retries when YouTube throttles
+    transcript = await run_in_threadpool(engine.fetch_transcript, video_id)
     if transcript:
         return {
             "video_id": video_id,
@@ -85,25 +122,31 @@ async def get_transcript(video_id: str):
 
 
 @app.post("/sync")
-async def sync_channel(request: SyncRequest, background_tasks: BackgroundTasks):
+async def sync_channel(
+    request: SyncRequest,
+    background_tasks: BackgroundTasks,
+    engine: SyncEngine = Depends(get_sync_engine),
+):
     """
     Sync new videos from the channel.
     For large syncs, consider running in background.
     """
     try:
-        engine = SyncEngine()
-        results = engine.sync_channel(limit=request.limit, force=request.force)
+        results = await run_in_threadpool(
+            engine.sync_channel, limit=request.limit, force=request.force
+        )
         return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/sync/video")
-async def sync_single_video(request: VideoSyncRequest):
+async def sync_single_video(
+    request: VideoSyncRequest, engine: SyncEngine = Depends(get_sync_engine)
+):
     """Sync a single video by ID."""
     try:
-        engine = SyncEngine()
-        gcs_uri = engine.sync_video(request.video_id, request.title)
+        gcs_uri = await run_in_threadpool(engine.sync_video, request.video_id, request.title)
         if gcs_uri:
             return {
                 "success": True,
@@ -120,10 +163,9 @@ async def sync_single_video(request: VideoSyncRequest):
 
 
 @app.get("/sync/status")
-async def get_sync_status():
+async def get_sync_status(engine: SyncEngine = Depends(get_sync_engine)):
     """Get current sync status and processed video count."""
     try:
-        engine = SyncEngine()
         processed = engine.get_processed_videos()
         return {
             "processed_count": len(processed),
@@ -140,16 +182,48 @@ async def get_sync_status():
 # File size limit: 50MB
 MAX_FILE_SIZE = 50 * 1024 * 1024
 
+# Read uploads 1MB at a time
+UPLOAD_READ_CHUNK_SIZE = 1024 * 1024
+
 ALLOWED_CONTENT_TYPES = [
     "application/pdf",
     "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
 ]
 
+# Parsing is CPU-bound pure Python; run it in worker processes so it doesn't
+# hold the GIL against the event loop and other requests. Workers come from a
+# forkserver rather than forking this process, which has gRPC and executor
+# threads running. The pool is created on first use and replaced if a worker
+# dies (e.g. MuPDF crashing or OOM on a malformed file), since a broken pool
+# rejects all later work.
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count(),
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return _parse_pool
+
+
+def _discard_parse_pool(pool: ProcessPoolExecutor) -> None:
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is pool:
+            _parse_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
 
 @app.post("/documents/upload", response_model=DocumentUploadResponse)
 async def upload_document(
     file: UploadFile = File(...),
     title: Optional[str] = Form(None),
+    engine: DocumentEngine = Depends(get_document_engine),
 ):
     """
     Upload a PDF or Word document for indexing.
@@ -164,19 +238,39 @@ async def upload_document(
             detail=f"Invalid file type: {file.content_type}. Allowed: PDF, DOCX",
         )
 
-    # Read file content
-    content = await file.read()
-
-    # Validate file size
-    if len(content) > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024 * 1024)}MB",
-        )
-
-    # Process document
-    engine = DocumentEngine()
-    result = engine.process_document(content, file.filename, title)
+    # Read file content in chunks, rejecting oversized uploads as soon as
+    # they cross the limit instead of buffering the whole body first
+    content = bytearray()
+    while chunk := await file.read(UPLOAD_READ_CHUNK_SIZE):
+        content.extend(chunk)
+        if len(content) > MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024 * 1024)}MB",
+            )
+
+    content = bytes(content)
+
+    # Parse off the event loop; unsupported types are reported by process_document
+    parsed = None
+    _, source_type = engine.get_parser(file.filename)
+    if source_type:
+        loop = asyncio.get_running_loop()
+        pool = _get_parse_pool()
+        try:
+            parsed = await loop.run_in_executor(
+                pool, parse_document, content, file.filename, source_type
+            )
+        except BrokenProcessPool:
+            _discard_parse_pool(pool)
+            raise HTTPException(status_code=500, detail="Document parser crashed")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    # Process document (chunking and GCS uploads) off the event loop
+    result = await run_in_threadpool(
+        engine.process_document, content, file.filename, title, parsed
+    )
 
     if not result.success:
         raise HTTPException(status_code=500, detail=result.error)
@@ -185,10 +279,11 @@ async def upload_document(
 
 
 @app.get("/documents")
-async def list_documents(limit: int = 20):
+async def list_documents(
+    limit: int = 20, engine: DocumentEngine = Depends(get_document_engine)
+):
     """List uploaded documents."""
     try:
-        engine = DocumentEngine()
         documents = engine.list_documents(limit=limit)
         return {"documents": documents, "count": len(documents)}
     except Exception as e:
@@ -196,9 +291,10 @@ async def list_documents(limit: int = 20):
 
 
 @app.get("/documents/{document_id}")
-async def get_document(document_id: str):
+async def get_document(
+    document_id: str, engine: DocumentEngine = Depends(get_document_engine)
+):
     """Get document metadata by ID."""
-    engine = DocumentEngine()
     metadata = engine.get_document_metadata(document_id)
 
     if not metadata:
@@ -212,15 +308,17 @@ async def get_document_signed_url(
     document_id: str,
     page: Optional[int] = None,
     expiration_minutes: int = 60,
+    filename: Optional[str] = None,
+    engine: DocumentEngine = Depends(get_document_engine),
 ):
     """
     Generate a signed URL for viewing a document.
 
     For PDFs, optionally include a page number for deep-linking.
+    Passing the original filename skips the metadata lookup.
     The URL will expire after the specified time (default: 60 minutes).
     """
-    engine = DocumentEngine()
-    url = engine.generate_signed_url(document_id, page, expiration_minutes)
+    url = engine.generate_signed_url(document_id, page, expiration_minutes, filename)
 
     if not url:
         raise HTTPException(status_code=404, detail="Document not found")
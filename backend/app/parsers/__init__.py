@@ -1,4 +1,6 @@
+from .base import ParseResult
 from .pdf_parser import PDFParser
 from .docx_parser import DocxParser
+from .worker import parse_document
 
-__all__ = ["PDFParser", "DocxParser"]
+__all__ = ["ParseResult", "PDFParser", "DocxParser", "parse_document"]
@@ -0,0 +1,12 @@
+"""
+Shared parser result type.
+"""
+
+from typing import List, NamedTuple, Tuple
+
+
+class ParseResult(NamedTuple):
+    """Extracted text plus page count from a single pass over a document."""
+    # (page_number, section_heading, text_content) tuples
+    pages: List[Tuple[int, str, str]]
+    page_count: int
@@ -1,12 +1,49 @@
 """
-Word document parser using python-docx.
+Word document parser using lxml over the raw DOCX package.
 Extracts text with section headings and estimated page numbers.
 """
 
-from typing import List, Tuple
+import re
+import zipfile
+import posixpath
+from typing import Iterator, List, Tuple
 from io import BytesIO
 
-from docx import Document
+from lxml import etree
+
+from .base import ParseResult
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+_OFFICE_DOCUMENT_REL = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+)
+_STYLES_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"
+
+# styles.xml stores built-in heading names in lowercase ("heading 1");
+# python-docx presents them as "Heading 1"
+_BUILTIN_HEADING = re.compile(r"heading [1-9]")
+
+_BODY = f"{_W}body"
+_P = f"{_W}p"
+_R = f"{_W}r"
+_HYPERLINK = f"{_W}hyperlink"
+_T = f"{_W}t"
+_VAL = f"{_W}val"
+
+# Run children that contribute text, matching python-docx's Run.text
+_RUN_TEXT = {
+    f"{_W}tab": "\t",
+    f"{_W}ptab": "\t",
+    f"{_W}cr": "\n",
+    f"{_W}noBreakHyphen": "-",
+}
+_BR = f"{_W}br"
+_BR_TYPE = f"{_W}type"
+
+# Uploaded XML is untrusted: never expand entities or fetch external
+# resources (XXE). Matches the options python-docx parses with.
+_XML_PARSER = etree.XMLParser(resolve_entities=False, no_network=True)
 
 
 class DocxParser:
@@ -15,7 +52,7 @@ class DocxParser:
     # Approximate characters per page for page estimation
     CHARS_PER_PAGE_ESTIMATE = 3000
 
-    def parse(self, file_content: bytes, filename: str) -> List[Tuple[int, str, str]]:
+    def parse(self, file_content: bytes, filename: str) -> ParseResult:
         """
         Parse DOCX and extract text with section headings.
 
@@ -24,29 +61,37 @@ class DocxParser:
             filename: Original filename (for logging)
 
         Returns:
-            List of tuples: (page_number, section_heading, text_content)
+            ParseResult whose pages are (page_number, section_heading,
+            text_content) tuples and whose page_count is estimated from the
+            total character count, as in get_page_count
             Note: page_number is estimated based on character count
         """
-        doc = Document(BytesIO(file_content))
         results = []
 
         current_heading = ""
         current_text = ""
         char_count = 0
+        total_chars = 0
         page_num = 1
+        heading_texts = []  # Non-blank headings, for the fallback below
+
+        for is_heading, text in self._iter_paragraphs(file_content):
+            total_chars += len(text)
 
-        for para in doc.paragraphs:
             # Detect headings (Heading 1, Heading 2, etc.)
-            if para.style and para.style.name and para.style.name.startswith("Heading"):
+            if is_heading:
+                if text.strip():
+                    heading_texts.append(text)
+
                 # Save previous section if it has content
                 if current_text.strip():
                     results.append((page_num, current_heading, current_text.strip()))
 
-                current_heading = para.text
+                current_heading = text
                 current_text = ""
             else:
-                current_text += para.text + "\n"
-                char_count += len(para.text)
+                current_text += text + "\n"
+                char_count += len(text)
 
                 # Estimate page breaks
                 if char_count >= self.CHARS_PER_PAGE_ESTIMATE:
@@ -59,12 +104,13 @@ class DocxParser:
 
         # If no content was extracted (no paragraphs), return empty
         if not results:
-            # Try to get any text from the document
-            all_text = "\n".join(para.text for para in doc.paragraphs if para.text.strip())
+            # Try to get any text from the document. Every body paragraph was
+            # blank to get here, so only the headings can contribute.
+            all_text = "\n".join(heading_texts)
             if all_text:
                 results.append((1, "", all_text))
 
-        return results
+        return ParseResult(results, self._estimate_page_count(total_chars))
 
     def get_page_count(self, file_content: bytes) -> int:
         """
@@ -73,6 +119,120 @@ class DocxParser:
         Note: DOCX files don't have a built-in page count property,
         so this is an approximation.
         """
-        doc = Document(BytesIO(file_content))
-        total_chars = sum(len(p.text) for p in doc.paragraphs)
+        total_chars = sum(len(text) for _, text in self._iter_paragraphs(file_content))
+        return self._estimate_page_count(total_chars)
+
+    def _estimate_page_count(self, total_chars: int) -> int:
         return max(1, (total_chars + self.CHARS_PER_PAGE_ESTIMATE - 1) // self.CHARS_PER_PAGE_ESTIMATE)
+
+    def _iter_paragraphs(self, file_content: bytes) -> Iterator[Tuple[bool, str]]:
+        """
+        Yield (is_heading, text) for each body-level paragraph.
+
+        Walks word/document.xml with iterparse instead of building the
+        python-docx object model, clearing each top-level element once it
+        has been read. Paragraphs nested in tables are skipped, as with
+        Document.paragraphs.
+        """
+        with zipfile.ZipFile(BytesIO(file_content)) as package:
+            document_path = self._document_path(package)
+            heading_ids, default_is_heading = self._heading_styles(package, document_path)
+
+            with package.open(document_path) as xml:
+                for _, elem in etree.iterparse(
+                    xml, events=("end",), resolve_entities=False, no_network=True
+                ):
+                    parent = elem.getparent()
+                    if parent is None or parent.tag != _BODY:
+                        continue
+
+                    if elem.tag == _P:
+                        style = elem.find(f"{_W}pPr/{_W}pStyle")
+                        style_id = style.get(_VAL) if style is not None else None
+                        if style_id in heading_ids:
+                            is_heading = heading_ids[style_id]
+                        else:
+                            is_heading = default_is_heading
+                        yield is_heading, self._paragraph_text(elem)
+
+                    # Free everything read so far under <w:body>
+                    elem.clear()
+                    while elem.getprevious() is not None:
+                        del parent[0]
+
+    @staticmethod
+    def _paragraph_text(p) -> str:
+        """Text of a <w:p>, following python-docx's Paragraph.text rules."""
+        parts = []
+        for child in p:
+            if child.tag == _R:
+                runs = (child,)
+            elif child.tag == _HYPERLINK:
+                runs = child.iterchildren(_R)
+            else:
+                continue
+
+            for run in runs:
+                for item in run:
+                    tag = item.tag
+                    if tag == _T:
+                        if item.text:
+                            parts.append(item.text)
+                    elif tag == _BR:
+                        # Only line breaks map to text; page/column breaks are ""
+                        if item.get(_BR_TYPE, "textWrapping") == "textWrapping":
+                            parts.append("\n")
+                    elif tag in _RUN_TEXT:
+                        parts.append(_RUN_TEXT[tag])
+        return "".join(parts)
+
+    @staticmethod
+    def _document_path(package: zipfile.ZipFile) -> str:
+        """Locate the main document part via the package relationships."""
+        try:
+            rels = etree.fromstring(package.read("_rels/.rels"), _XML_PARSER)
+        except KeyError:
+            return "word/document.xml"
+        for rel in rels.iter(_PKG_REL):
+            if rel.get("Type") == _OFFICE_DOCUMENT_REL:
+                return rel.get("Target").lstrip("/")
+        return "word/document.xml"
+
+    @staticmethod
+    def _heading_styles(package: zipfile.ZipFile, document_path: str) -> Tuple[dict, bool]:
+        """
+        Map paragraph style IDs to whether they are headings.
+
+        Returns the mapping and whether the default paragraph style (used
+        for paragraphs with no or an unknown style ID) is a heading.
+        """
+        doc_dir, doc_name = posixpath.split(document_path)
+        styles_path = posixpath.join(doc_dir, "styles.xml")
+        try:
+            rels = etree.fromstring(
+                package.read(posixpath.join(doc_dir, "_rels", f"{doc_name}.rels")),
+                _XML_PARSER,
+            )
+            for rel in rels.iter(_PKG_REL):
+                if rel.get("Type") == _STYLES_REL:
+                    styles_path = posixpath.normpath(posixpath.join(doc_dir, rel.get("Target")))
+                    break
+            styles = etree.fromstring(package.read(styles_path), _XML_PARSER)
+        except KeyError:
+            return {}, False
+
+        heading_ids = {}
+        defaults: List[bool] = []
+        for style in styles.iterchildren(f"{_W}style"):
+            if style.get(f"{_W}type", "paragraph") != "paragraph":
+                continue
+            name_el = style.find(f"{_W}name")
+            name = name_el.get(_VAL) if name_el is not None else None
+            is_heading = bool(name) and (
+                name.startswith("Heading") or _BUILTIN_HEADING.fullmatch(name) is not None
+            )
+            heading_ids[style.get(f"{_W}styleId")] = is_heading
+            if style.get(f"{_W}default") in ("1", "true", "on"):
+                defaults.append(is_heading)
+
+        return heading_ids, defaults[-1] if defaults else False
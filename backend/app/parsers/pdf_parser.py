@@ -1,18 +1,17 @@
 """
-PDF document parser using PyPDF2.
+PDF document parser using PyMuPDF.
 Extracts text with page numbers for deep-linking.
 """
 
-from typing import List, Tuple
-from io import BytesIO
+import pymupdf
 
-from PyPDF2 import PdfReader
+from .base import ParseResult
 
 
 class PDFParser:
     """Parse PDF documents and extract text with page information."""
 
-    def parse(self, file_content: bytes, filename: str) -> List[Tuple[int, str, str]]:
+    def parse(self, file_content: bytes, filename: str) -> ParseResult:
         """
         Parse PDF and extract text with page numbers.
 
@@ -21,22 +20,27 @@ class PDFParser:
             filename: Original filename (for logging)
 
         Returns:
-            List of tuples: (page_number, section_heading, text_content)
+            ParseResult whose pages are (page_number, section_heading,
+            text_content) tuples and whose page_count is the total page count
             Note: section_heading is empty for PDFs as we can't reliably detect headings
         """
-        reader = PdfReader(BytesIO(file_content))
         pages = []
+        with pymupdf.open(stream=file_content, filetype="pdf") as doc:
+            for page_index, page in enumerate(doc):
+                text = page.get_text("text").strip()
+                # Only include pages with content
+                if text:
+                    pages.append((page_index + 1, "", text))
+            page_count = doc.page_count
 
-        for page_num, page in enumerate(reader.pages, start=1):
-            text = page.extract_text() or ""
-            text = text.strip()
-
-            if text:  # Only include pages with content
-                pages.append((page_num, "", text))
-
-        return pages
+        return ParseResult(pages, page_count)
 
     def get_page_count(self, file_content: bytes) -> int:
-        """Return total page count of the PDF."""
-        reader = PdfReader(BytesIO(file_content))
-        return len(reader.pages)
+        """
+        Return total page count of the PDF.
+
+        Callers that also need the text should use parse(), whose result
+        already carries the page count, rather than opening the PDF twice.
+        """
+        with pymupdf.open(stream=file_content, filetype="pdf") as doc:
+            return doc.page_count
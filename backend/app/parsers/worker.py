@@ -0,0 +1,15 @@
+"""
+Document parsing entry point for worker processes.
+Lives in the parsers package so pool workers import only the parsers,
+not the FastAPI app.
+"""
+
+from .base import ParseResult
+from .pdf_parser import PDFParser
+from .docx_parser import DocxParser
+
+
+def parse_document(file_content: bytes, filename: str, source_type: str) -> ParseResult:
+    """Parse a document inside a pool worker (top-level so it can be pickled)."""
+    parser = PDFParser() if source_type == "pdf" else DocxParser()
+    return parser.parse(file_content, filename)
@@ -3,30 +3,42 @@ YouTube Transcript Sync Engine
 Fetches transcripts from Spencer's channel and uploads to GCS in JSONL format.
 """
 
-import json
+import gzip
 import logging
-from typing import Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Iterable, Iterator, Optional
 from datetime import datetime
+from io import BytesIO
 
+import orjson
 import scrapetube
-from youtube_transcript_api import YouTubeTranscriptApi
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from youtube_transcript_api import YouTubeTranscriptApi, YouTubeRequestFailed, RequestBlocked
 from youtube_transcript_api.formatters import JSONFormatter
 from google.cloud import storage
 from google.cloud import firestore
 
 from .config import get_settings
+from .clients import get_storage_client, get_firestore_client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 class SyncEngine:
-    def __init__(self):
+    # Videos synced concurrently by sync_channel
+    SYNC_WORKERS = 8
+
+    def __init__(
+        self,
+        storage_client: Optional[storage.Client] = None,
+        db: Optional[firestore.Client] = None,
+    ):
         self.settings = get_settings()
         self.ytt_api = YouTubeTranscriptApi()
-        self.storage_client = storage.Client(project=self.settings.gcp_project_id)
+        self.storage_client = storage_client or get_storage_client()
         self.bucket = self.storage_client.bucket(self.settings.gcs_bucket)
-        self.db = firestore.Client(project=self.settings.gcp_project_id)
+        self.db = db or get_firestore_client()
 
     def get_processed_videos(self) -> set:
         """Get set of already processed video IDs from Firestore."""
@@ -37,36 +49,63 @@ class SyncEngine:
         return set()
 
     def save_processed_videos(self, video_ids: set):
-        """Save processed video IDs to Firestore."""
+        """
+        Add video IDs to the processed set in Firestore.
+
+        Only the given IDs are sent; ArrayUnion merges them into the stored
+        list server-side instead of rewriting the whole list.
+        """
         doc_ref = self.db.collection("sync_state").document("last_sync")
         doc_ref.set({
-            "processed_video_ids": list(video_ids),
+            "processed_video_ids": firestore.ArrayUnion(list(video_ids)),
             "last_updated": datetime.utcnow().isoformat()
-        })
+        }, merge=True)
 
-    def get_channel_videos(self, limit: Optional[int] = None) -> list:
-        """Fetch video metadata from the YouTube channel."""
+    def get_channel_videos(self, limit: Optional[int] = None) -> Iterator[dict]:
+        """
+        Fetch video metadata from the YouTube channel.
+
+        Videos are yielded as scrapetube pages through the listing, so
+        callers can start on the first videos before the rest are fetched.
+        """
         logger.info(f"Fetching videos from channel: {self.settings.youtube_channel_handle}")
 
-        videos = []
+        count = 0
         for video in scrapetube.get_channel(
             channel_url=f"https://www.youtube.com/{self.settings.youtube_channel_handle}",
             limit=limit
         ):
-            videos.append({
+            count += 1
+            yield {
                 "video_id": video["videoId"],
                 "title": video.get("title", {}).get("runs", [{}])[0].get("text", "Unknown"),
                 "thumbnail": video.get("thumbnail", {}).get("thumbnails", [{}])[-1].get("url", ""),
                 "published": video.get("publishedTimeText", {}).get("simpleText", ""),
-            })
+            }
 
-        logger.info(f"Found {len(videos)} videos")
-        return videos
+        logger.info(f"Found {count} videos")
+
+    @retry(
+        stop=stop_after_attempt(5),
+        wait=wait_random_exponential(multiplier=1, max=60),
+        # Blocked/throttled requests (429 is raised as IpBlocked, a
+        # RequestBlocked) and other failed YouTube requests are transient;
+        # missing or disabled transcripts are not
+        retry=retry_if_exception_type((YouTubeRequestFailed, RequestBlocked)),
+        reraise=True
+    )
+    def _fetch_with_retry(self, video_id: str):
+        return self.ytt_api.fetch(video_id)
 
     def fetch_transcript(self, video_id: str) -> Optional[list]:
-        """Fetch transcript for a single video with 1-second precision."""
+        """
+        Fetch transcript for a single video with 1-second precision.
+
+        Throttled fetches are retried with jittered exponential backoff;
+        returns None if the transcript still can't be fetched.
+        """
         try:
-            transcript = self.ytt_api.fetch(video_id)
+            transcript = self._fetch_with_retry(video_id)
             return [
                 {
                     "text": entry.text,
@@ -79,90 +118,112 @@ class SyncEngine:
             logger.warning(f"Could not fetch transcript for {video_id}: {e}")
             return None
 
-    def create_jsonl_document(self, video_id: str, title: str, transcript: list) -> list:
+    def create_jsonl_document(self, video_id: str, title: str, transcript: list) -> Iterator[dict]:
         """
         Create JSONL documents for Vertex AI Search.
         Each transcript segment becomes a separate document with metadata.
         Also uploads individual .txt files for content and references them via uri.
+
+        Documents are yielded as their chunk boundaries are reached, so the
+        transcript is walked once and no document list is built.
         """
-        documents = []
-        chunks = []  # Store chunks to upload as .txt files
+        # Fields shared by every chunk of this video; per-chunk values are
+        # filled into a copy. Placeholders keep the key order of the JSON stable.
+        struct_base = {
+            "video_id": video_id,
+            "title": title,
+            "timestamp_start": None,
+            "timestamp_end": None,
+            "channel": self.settings.youtube_channel_handle,
+            "youtube_url": None,
+            "transcript": None,
+        }
+        url_base = f"https://youtube.com/watch?v={video_id}&t="
 
         # Create chunks of transcript segments (roughly 500 chars each)
-        current_chunk = []
-        current_text = ""
+        current_parts = []
+        current_len = 0  # Length of the parts each prefixed by a space
         chunk_start = 0
+        chunk_end = 0
 
         for entry in transcript:
-            current_chunk.append(entry)
-            current_text += " " + entry["text"]
-
-            if len(current_text) >= 400:  # Chunk at ~400 chars
-                chunk_end = entry["start"] + entry["duration"]
-                chunk_id = f"{video_id}_{int(chunk_start)}"
-                chunks.append((chunk_id, current_text.strip()))
-
-                doc = {
-                    "id": chunk_id,
-                    "structData": {
-                        "video_id": video_id,
-                        "title": title,
-                        "timestamp_start": int(chunk_start),
-                        "timestamp_end": int(chunk_end),
-                        "channel": self.settings.youtube_channel_handle,
-                        "youtube_url": f"https://youtube.com/watch?v={video_id}&t={int(chunk_start)}s",
-                        "transcript": current_text.strip()
-                    },
-                    "content": {
-                        "mimeType": "text/plain",
-                        "uri": f"gs://{self.settings.gcs_bucket}/{self.settings.transcripts_prefix}/{chunk_id}.txt"
-                    }
-                }
-                documents.append(doc)
+            text = entry["text"]
+            current_parts.append(text)
+            current_len += len(text) + 1
+            chunk_end = entry["start"] + entry["duration"]
+
+            if current_len >= 400:  # Chunk at ~400 chars
+                yield self._transcript_document(
+                    video_id, struct_base, url_base,
+                    chunk_start, chunk_end, " ".join(current_parts).strip()
+                )
 
                 # Reset for next chunk
-                chunk_start = entry["start"] + entry["duration"]
-                current_chunk = []
-                current_text = ""
-
-        # Handle remaining content
-        if current_text.strip():
-            chunk_id = f"{video_id}_{int(chunk_start)}"
-            chunks.append((chunk_id, current_text.strip()))
-
-            doc = {
-                "id": chunk_id,
-                "structData": {
-                    "video_id": video_id,
-                    "title": title,
-                    "timestamp_start": int(chunk_start),
-                    "timestamp_end": int(transcript[-1]["start"] + transcript[-1]["duration"]),
-                    "channel": self.settings.youtube_channel_handle,
-                    "youtube_url": f"https://youtube.com/watch?v={video_id}&t={int(chunk_start)}s",
-                    "transcript": current_text.strip()
-                },
-                "content": {
-                    "mimeType": "text/plain",
-                    "uri": f"gs://{self.settings.gcs_bucket}/{self.settings.transcripts_prefix}/{chunk_id}.txt"
-                }
+                chunk_start = chunk_end
+                current_parts.clear()
+                current_len = 0
+
+        # Flush remaining content
+        chunk_text = " ".join(current_parts).strip()
+        if chunk_text:
+            yield self._transcript_document(
+                video_id, struct_base, url_base, chunk_start, chunk_end, chunk_text
+            )
+
+    def _transcript_document(
+        self,
+        video_id: str,
+        struct_base: dict,
+        url_base: str,
+        chunk_start: float,
+        chunk_end: float,
+        chunk_text: str,
+    ) -> dict:
+        """Upload one chunk's .txt file and build its document."""
+        start = int(chunk_start)
+        start_s = str(start)
+        chunk_id = f"{video_id}_{start_s}"
+        blob_path = f"{self.settings.transcripts_prefix}/{chunk_id}.txt"
+        self.bucket.blob(blob_path).upload_from_string(chunk_text, content_type="text/plain")
+
+        struct_data = struct_base.copy()
+        struct_data["timestamp_start"] = start
+        struct_data["timestamp_end"] = int(chunk_end)
+        struct_data["youtube_url"] = url_base + start_s + "s"
+        struct_data["transcript"] = chunk_text
+
+        return {
+            "id": chunk_id,
+            "structData": struct_data,
+            "content": {
+                "mimeType": "text/plain",
+                "uri": f"gs://{self.settings.gcs_bucket}/{blob_path}"
             }
-            documents.append(doc)
-
-        # Upload individual .txt files for each chunk
-        for chunk_id, text in chunks:
-            blob_path = f"{self.settings.transcripts_prefix}/{chunk_id}.txt"
-            blob = self.bucket.blob(blob_path)
-            blob.upload_from_string(text, content_type="text/plain")
-
-        return documents
+        }
 
-    def upload_to_gcs(self, video_id: str, documents: list) -> str:
+    def upload_to_gcs(self, video_id: str, documents: Iterable[dict]) -> str:
         """Upload JSONL documents to Cloud Storage."""
         blob_path = f"{self.settings.transcripts_prefix}/{video_id}.jsonl"
         blob = self.bucket.blob(blob_path)
 
-        jsonl_content = "\n".join(json.dumps(doc) for doc in documents)
-        blob.upload_from_string(jsonl_content, content_type="application/jsonl")
+        # Transcript records repeat most of their fields, so gzip shrinks the
+        # upload several-fold. The object keeps its .jsonl name (imports glob
+        # on *.jsonl); Content-Encoding lets GCS transcode it on read.
+        # Documents are compressed as they arrive, so the iterable can be a
+        # generator.
+        buffer = BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=6) as gz:
+            for i, doc in enumerate(documents):
+                if i:
+                    gz.write(b"\n")
+                gz.write(orjson.dumps(doc))
+
+        # Passing the size keeps this a single multipart request rather than
+        # a resumable upload with its extra initiation round trip
+        size = buffer.tell()
+        buffer.seek(0)
+        blob.content_encoding = "gzip"
+        blob.upload_from_file(buffer, size=size, content_type="application/jsonl")
 
         gcs_uri = f"gs://{self.settings.gcs_bucket}/{blob_path}"
         logger.info(f"Uploaded transcript to {gcs_uri}")
@@ -193,25 +254,29 @@ class SyncEngine:
             Summary of sync operation
         """
         processed = set() if force else self.get_processed_videos()
-        videos = self.get_channel_videos(limit=limit)
 
         results = {
-            "total_videos": len(videos),
+            "total_videos": 0,
             "already_processed": 0,
             "synced": [],
             "failed": [],
             "no_transcript": []
         }
 
-        for video in videos:
+        def record(future, video):
             video_id = video["video_id"]
             title = video["title"]
 
-            if video_id in processed:
-                results["already_processed"] += 1
-                continue
-
-            gcs_uri = self.sync_video(video_id, title)
+            try:
+                gcs_uri = future.result()
+            except Exception as e:
+                logger.error(f"Failed to sync {video_id}: {e}")
+                results["failed"].append({
+                    "video_id": video_id,
+                    "title": title,
+                    "error": str(e)
+                })
+                return
 
             if gcs_uri:
                 results["synced"].append({
@@ -219,16 +284,39 @@ class SyncEngine:
                     "title": title,
                     "gcs_uri": gcs_uri
                 })
-                processed.add(video_id)
             else:
                 results["no_transcript"].append({
                     "video_id": video_id,
                     "title": title
                 })
 
-        # Save updated processed list
+        # Each sync is mostly waiting on YouTube and GCS, so run several at
+        # once while the channel listing is still being paged. At most
+        # twice SYNC_WORKERS syncs are queued; results are consumed on this
+        # thread, so `results` needs no locking.
+        max_in_flight = self.SYNC_WORKERS * 2
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.SYNC_WORKERS) as executor:
+            for video in self.get_channel_videos(limit=limit):
+                results["total_videos"] += 1
+                if video["video_id"] in processed:
+                    results["already_processed"] += 1
+                    continue
+
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(future, in_flight.pop(future))
+
+                future = executor.submit(self.sync_video, video["video_id"], video["title"])
+                in_flight[future] = video
+
+            for future in as_completed(in_flight):
+                record(future, in_flight[future])
+
+        # Record newly synced videos
         if results["synced"]:
-            self.save_processed_videos(processed)
+            self.save_processed_videos({video["video_id"] for video in results["synced"]})
 
         return results
 
@@ -236,7 +324,7 @@ class SyncEngine:
 def list_channel_videos(limit: int = 10) -> list:
     """Helper function to list videos from the channel."""
     engine = SyncEngine()
-    return engine.get_channel_videos(limit=limit)
+    return list(engine.get_channel_videos(limit=limit))
 
 
 def test_transcript(video_id: str) -> Optional[list]:
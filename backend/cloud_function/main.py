@@ -3,9 +3,51 @@ Cloud Function to fetch YouTube transcripts.
 Runs from GCP infrastructure to avoid IP blocking.
 """
 
-import json
+import time
+
+import orjson
 import functions_framework
-from youtube_transcript_api import YouTubeTranscriptApi
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tenacity import (
+    Retrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+)
+from youtube_transcript_api import YouTubeTranscriptApi, YouTubeRequestFailed, RequestBlocked
+
+# Concurrent fetches per batch request
+BATCH_WORKERS = 10
+
+# Deployed function timeout (the Cloud Functions default); keep in sync with
+# the deploy --timeout
+FUNCTION_TIMEOUT = 60
+# Stop retrying this long before the timeout so the batch still returns
+# per-video results
+RETRY_HEADROOM = 15
+# Cap on a single backoff sleep
+RETRY_WAIT_MAX = 8
+
+# Created once per instance so warm invocations reuse its HTTP session
+ytt = YouTubeTranscriptApi()
+
+
+def _fetch_with_retry(video_id, deadline):
+    """
+    Fetch a transcript, retrying transient failures until `deadline`
+    (a time.monotonic() value) would be passed by the next backoff.
+    """
+    retryer = Retrying(
+        # Jittered so the batch's worker threads don't back off in lockstep
+        wait=wait_random_exponential(multiplier=1, max=RETRY_WAIT_MAX),
+        stop=(
+            stop_after_attempt(5)
+            | (lambda retry_state: time.monotonic() + RETRY_WAIT_MAX >= deadline)
+        ),
+        # Blocked/throttled requests (429 is raised as IpBlocked, a
+        # RequestBlocked) and other failed YouTube requests are transient;
+        # missing or disabled transcripts are not
+        retry=retry_if_exception_type((YouTubeRequestFailed, RequestBlocked)),
+        reraise=True
+    )
+    return retryer(ytt.fetch, video_id)
 
 
 @functions_framework.http
@@ -41,11 +83,9 @@ def fetch_transcript(request):
         video_id = data.get('video_id')
 
     if not video_id:
-        return (json.dumps({'error': 'video_id is required'}), 400, headers)
+        return (orjson.dumps({'error': 'video_id is required'}), 400, headers)
 
     try:
-        # Use the newer API - instantiate and fetch
-        ytt = YouTubeTranscriptApi()
         transcript = ytt.fetch(video_id)
 
         # Format response
@@ -55,7 +95,7 @@ def fetch_transcript(request):
             'duration': entry.duration
         } for entry in transcript]
 
-        return (json.dumps({
+        return (orjson.dumps({
             'video_id': video_id,
             'transcript': result
         }), 200, headers)
@@ -63,17 +103,17 @@ def fetch_transcript(request):
     except Exception as e:
         error_msg = str(e)
         if 'disabled' in error_msg.lower():
-            return (json.dumps({
+            return (orjson.dumps({
                 'error': 'Transcripts are disabled for this video',
                 'video_id': video_id
             }), 404, headers)
         elif 'not found' in error_msg.lower() or 'no transcript' in error_msg.lower():
-            return (json.dumps({
+            return (orjson.dumps({
                 'error': 'No transcript found for this video',
                 'video_id': video_id
             }), 404, headers)
         else:
-            return (json.dumps({
+            return (orjson.dumps({
                 'error': error_msg,
                 'video_id': video_id
             }), 500, headers)
@@ -101,34 +141,46 @@ def fetch_batch_transcripts(request):
         return ('', 204, headers)
 
     if not request.is_json:
-        return (json.dumps({'error': 'JSON body required'}), 400, headers)
+        return (orjson.dumps({'error': 'JSON body required'}), 400, headers)
 
     data = request.get_json()
     video_ids = data.get('video_ids', [])
 
     if not video_ids:
-        return (json.dumps({'error': 'video_ids array is required'}), 400, headers)
+        return (orjson.dumps({'error': 'video_ids array is required'}), 400, headers)
 
-    ytt = YouTubeTranscriptApi()
     results = {}
 
-    for video_id in video_ids:
-        try:
-            transcript = ytt.fetch(video_id)
-
-            results[video_id] = {
-                'success': True,
-                'transcript': [{
-                    'text': entry.text,
-                    'start': entry.start,
-                    'duration': entry.duration
-                } for entry in transcript]
-            }
-
-        except Exception as e:
-            results[video_id] = {
-                'success': False,
-                'error': str(e)
-            }
-
-    return (json.dumps(results), 200, headers)
+    # One retry deadline for the whole batch, since later videos wait in the
+    # executor queue behind earlier ones
+    deadline = time.monotonic() + FUNCTION_TIMEOUT - RETRY_HEADROOM
+
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+        futures = {
+            executor.submit(_fetch_with_retry, video_id, deadline): video_id
+            for video_id in video_ids
+        }
+        for future in as_completed(futures):
+            video_id = futures[future]
+            try:
+                transcript = future.result()
+
+                results[video_id] = {
+                    'success': True,
+                    'transcript': [{
+                        'text': entry.text,
+                        'start': entry.start,
+                        'duration': entry.duration
+                    } for entry in transcript]
+                }
+
+            except Exception as e:
+                results[video_id] = {
+                    'success': False,
+                    'error': str(e)
+                }
+
+    # Report results in request order
+    results = {video_id: results[video_id] for video_id in video_ids}
+
+    return (orjson.dumps(results), 200, headers)
@@ -2,18 +2,21 @@
 """Import transcripts from Spencer's YouTube channel into Vertex AI Search."""
 
 import scrapetube
-import json
+import orjson
 import base64
 import subprocess
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from youtube_transcript_api import YouTubeTranscriptApi
 
 # Get 5 videos from Spencer's channel
 print("Fetching videos from @MadscienceLPTECH...")
-videos = list(scrapetube.get_channel(
+videos = scrapetube.get_channel(
     channel_url="https://www.youtube.com/@MadscienceLPTECH",
     limit=5
-))
+)
 
 ytt = YouTubeTranscriptApi()
 
@@ -21,9 +24,37 @@ ytt = YouTubeTranscriptApi()
 print("Getting access token...")
 token = subprocess.check_output(["gcloud", "auth", "print-access-token"]).decode().strip()
 
+# One pooled keep-alive session for all Google API calls. Only idempotent
+# requests (the operation polls) are retried.
+session = requests.Session()
+session.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        # Hand back the last response so its error body can be reported
+        raise_on_status=False,
+    ),
+))
+session.headers.update({
+    "Authorization": f"Bearer {token}",
+    "Content-Type": "application/json",
+    "X-Goog-User-Project": "bedini-answer-bot"
+})
+
 BASE = "https://discoveryengine.googleapis.com/v1/projects/bedini-answer-bot/locations/global/collections/default_collection/dataStores/spencer-transcripts/branches/default_branch/documents"
 
-doc_count = 0
+# All chunks are staged as one JSONL file and ingested with a single
+# documents:import call instead of one PATCH per chunk
+BUCKET = "spencer-knowledge-vault"
+IMPORT_BLOB = f"imports/transcripts-{int(time.time())}.jsonl"
+UPLOAD_URL = f"https://storage.googleapis.com/upload/storage/v1/b/{BUCKET}/o"
+OPERATIONS_BASE = "https://discoveryengine.googleapis.com/v1"
+POLL_INTERVAL = 5
+
+all_docs = []
 processed_videos = []
 
 for v in videos:
@@ -37,15 +68,28 @@ for v in videos:
         transcript = ytt.fetch(video_id)
         print(f"  Got {len(transcript)} entries")
 
+        # Fields shared by every chunk of this video
+        base_struct = {
+            "video_id": video_id,
+            "title": title,
+            "channel": "@MadscienceLPTECH",
+        }
+        url_prefix = f"https://youtube.com/watch?v={video_id}&t="
+
         # Create chunks of ~400 chars
-        current_text = ""
+        docs = []
+        buf = bytearray()  # UTF-8 chunk text, each entry prefixed by a space
         chunk_start = 0
         chunk_num = 0
 
         for entry in transcript:
-            current_text += " " + entry.text
+            buf += b" "
+            buf += entry.text.encode("utf-8", "replace")
 
-            if len(current_text) >= 400:
+            if len(buf) >= 400:
+                data = buf.strip()
+                text = data.decode("utf-8")
+                start_s = int(chunk_start)
                 chunk_end = entry.start + entry.duration
                 doc_id = f"{video_id}_{chunk_num}"
 
@@ -53,75 +97,51 @@ for v in videos:
                 doc = {
                     "id": doc_id,
                     "structData": {
-                        "video_id": video_id,
-                        "title": title,
-                        "timestamp_start": int(chunk_start),
+                        **base_struct,
+                        "timestamp_start": start_s,
                         "timestamp_end": int(chunk_end),
-                        "channel": "@MadscienceLPTECH",
-                        "youtube_url": f"https://youtube.com/watch?v={video_id}&t={int(chunk_start)}s",
-                        "transcript": current_text.strip()
+                        "youtube_url": f"{url_prefix}{start_s}s",
+                        "transcript": text
                     },
                     "content": {
                         "mimeType": "text/plain",
-                        "rawBytes": base64.b64encode(current_text.strip().encode()).decode()
+                        "rawBytes": base64.b64encode(data).decode("ascii")
                     }
                 }
 
-                # Upload to Vertex AI
-                resp = requests.patch(
-                    f"{BASE}/{doc_id}?allowMissing=true",
-                    headers={
-                        "Authorization": f"Bearer {token}",
-                        "Content-Type": "application/json",
-                        "X-Goog-User-Project": "bedini-answer-bot"
-                    },
-                    json=doc
-                )
-
-                if resp.status_code == 200:
-                    doc_count += 1
-                else:
-                    print(f"  ERROR uploading {doc_id}: {resp.text[:100]}")
+                docs.append(doc)
 
                 # Reset for next chunk
                 chunk_start = entry.start + entry.duration
-                current_text = ""
+                buf.clear()
                 chunk_num += 1
 
         # Handle remaining text
-        if current_text.strip():
+        data = buf.strip()
+        if data:
+            text = data.decode("utf-8")
+            start_s = int(chunk_start)
             doc_id = f"{video_id}_{chunk_num}"
             doc = {
                 "id": doc_id,
                 "structData": {
-                    "video_id": video_id,
-                    "title": title,
-                    "timestamp_start": int(chunk_start),
+                    **base_struct,
+                    "timestamp_start": start_s,
                     "timestamp_end": int(transcript[-1].start + transcript[-1].duration),
-                    "channel": "@MadscienceLPTECH",
-                    "youtube_url": f"https://youtube.com/watch?v={video_id}&t={int(chunk_start)}s",
-                    "transcript": current_text.strip()
+                    "youtube_url": f"{url_prefix}{start_s}s",
+                    "transcript": text
                 },
                 "content": {
                     "mimeType": "text/plain",
-                    "rawBytes": base64.b64encode(current_text.strip().encode()).decode()
+                    "rawBytes": base64.b64encode(data).decode("ascii")
                 }
             }
 
-            resp = requests.patch(
-                f"{BASE}/{doc_id}?allowMissing=true",
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json",
-                    "X-Goog-User-Project": "bedini-answer-bot"
-                },
-                json=doc
-            )
-
-            if resp.status_code == 200:
-                doc_count += 1
+            docs.append(doc)
             chunk_num += 1
 
+        all_docs.extend(docs)
+
         print(f"  Created {chunk_num} chunks")
         processed_videos.append({
             "title": title,
@@ -132,6 +152,47 @@ for v in videos:
     except Exception as e:
         print(f"  ERROR: {e}")
 
+doc_count = 0
+if all_docs:
+    # Stage the JSONL in GCS
+    print(f"\nUploading {len(all_docs)} documents to gs://{BUCKET}/{IMPORT_BLOB}...")
+    resp = session.post(
+        UPLOAD_URL,
+        params={"uploadType": "media", "name": IMPORT_BLOB},
+        headers={"Content-Type": "application/jsonl"},
+        data=b"\n".join(orjson.dumps(doc) for doc in all_docs)
+    )
+    resp.raise_for_status()
+
+    # Import it in one long-running operation
+    resp = session.post(f"{BASE}:import", data=orjson.dumps({
+        "gcsSource": {
+            "inputUris": [f"gs://{BUCKET}/{IMPORT_BLOB}"],
+            "dataSchema": "document"
+        },
+        "reconciliationMode": "INCREMENTAL"
+    }))
+    resp.raise_for_status()
+    operation = resp.json()
+    print(f"Import started: {operation['name']}")
+
+    while not operation.get("done"):
+        time.sleep(POLL_INTERVAL)
+        resp = session.get(f"{OPERATIONS_BASE}/{operation['name']}")
+        resp.raise_for_status()
+        operation = resp.json()
+
+    if "error" in operation:
+        print(f"  ERROR: import failed: {operation['error'].get('message')}")
+    else:
+        metadata = operation.get("metadata", {})
+        doc_count = int(metadata.get("successCount", 0))
+        failures = int(metadata.get("failureCount", 0))
+        if failures:
+            print(f"  ERROR: {failures} documents failed to import")
+            for sample in operation.get("response", {}).get("errorSamples", [])[:5]:
+                print(f"    {sample.get('message', '')[:100]}")
+
 print(f"\n{'='*50}")
 print(f"Total documents created: {doc_count}")
 print(f"\nProcessed videos:")